@@ -1,5 +1,7 @@
 """Time difference control algorithms"""
 
+from controls import control_numba
+
 class TDControl:
     """Action value temporal difference control
     Generalized policy iteration algorithm where the temporal difference method
@@ -17,6 +19,16 @@ class TDControl:
         self.alpha = alpha
         self.discount = discount
 
+        # Direct references to the structures the per-step update touches,
+        # cached by _bind so that the fast path reads them without going
+        # through the agent/environment method chain on every step
+        self._bound_agent = None
+        self._table = None
+        self._state_index = None
+        self._epsilon = 0.0
+        self._n_actions = 0
+        self._rng = None
+
     def update(self, agent, environment):
         """Update the agent's action-value function using the feedback from
         the environment
@@ -27,6 +39,53 @@ class TDControl:
         """
         raise NotImplementedError()
 
+    def _can_use_kernel(self, agent):
+        """Can the update run through the numba-compiled tabular kernels?
+
+        The kernels operate directly on a single contiguous Q-table, so they
+        only apply to non-double tabular action-value functions. Binds the
+        agent on first use
+
+        Args:
+            agent: agent whose action-value is being learned
+        """
+        if agent.action_value.name != 'simple_tabular':
+            return False
+        if agent is not self._bound_agent:
+            self._bind(agent)
+        return True
+
+    def _bind(self, agent):
+        """Cache direct references to the agent's Q-table and policy
+        parameters, devirtualizing the per-step access chain
+
+        Args:
+            agent: agent whose action-value is being learned
+        """
+        self._bound_agent = agent
+        self._table = agent.action_value.tabular_action_value
+        self._state_index = agent.action_value._state_index
+        self._epsilon = 0.0 if agent.greedy else agent.action_value.epsilon
+        self._n_actions = len(agent.action_value.actions)
+        # The policy's own generator also feeds the kernels' exploration
+        # draws, so seeding the policy makes the whole update reproducible
+        self._rng = agent.action_value._rng
+
+    def _transition_rows(self, environment):
+        """Resolve once the Q-table rows of the states involved in the
+        latest transition of the agent
+
+        Args:
+            environment: environment with which the agent is interacting
+        """
+        # Flat integer states index the table directly, so the dict hop only
+        # remains for environments with non-integer states
+        if self._state_index is None:
+            return (environment.get_previous_agent_state(),
+                    environment.get_agent_state())
+        return (self._state_index[environment.get_previous_agent_state()],
+                self._state_index[environment.get_agent_state()])
+
 
 class Sarsa(TDControl):
     """On-policy TD control algorithm using the Sarsa prediction method
@@ -44,6 +103,15 @@ class Sarsa(TDControl):
         """Update the agent's action-value function using the target:
         R_t + discount*Q(S_{t+1}, A_{t+1})
         """
+        if self._can_use_kernel(agent):
+            previous_row, row = self._transition_rows(environment)
+            control_numba.sarsa_step(
+                self._table, previous_row,
+                environment.get_latest_action(), environment.latest_reward,
+                row, self.alpha, self.discount, self._epsilon,
+                self._rng.random(), int(self._rng.integers(self._n_actions)))
+            return
+
         target = (environment.get_latest_reward()
                   + self.discount*agent.get_next_action_value(environment))
         td_error = target - agent.get_action_value_to_update(environment)
@@ -67,6 +135,15 @@ class ExpectedSarsa(TDControl):
         """Update the agent's action-value function using the target:
         R_t + discount*E(Q(S_{t+1}, A))
         """
+        if self._can_use_kernel(agent):
+            previous_row, row = self._transition_rows(environment)
+            control_numba.expected_sarsa_step(
+                self._table, previous_row,
+                environment.get_latest_action(), environment.latest_reward,
+                row, self.alpha, self.discount,
+                agent.action_value.epsilon)
+            return
+
         target = (environment.get_latest_reward()
                   + self.discount*agent.get_expected_next_action_value(
                       environment))
@@ -91,6 +168,14 @@ class QLearning(TDControl):
         """Update the agent's action-value function using the target:
         R_t + discount*max_a(Q(S_{t+1}, a))
         """
+        if self._can_use_kernel(agent):
+            previous_row, row = self._transition_rows(environment)
+            control_numba.qlearning_step(
+                self._table, previous_row,
+                environment.get_latest_action(), environment.latest_reward,
+                row, self.alpha, self.discount)
+            return
+
         target = (environment.get_latest_reward()
                   + self.discount*agent.get_best_next_action_value(
                       environment))
@@ -0,0 +1,109 @@
+"""Numba-compiled kernels for the inner TD-control update step
+
+The per-step update of the tabular TD-control algorithms crosses several
+Python method calls and dict lookups, so the interpreter overhead dominates
+the actual float math. These kernels compile the numeric core with numba and
+operate directly on the contiguous Q-table given the row indices of the
+states involved in the transition
+"""
+import numpy as np
+from numba import njit
+
+@njit(inline='always')
+def argmax_random_tie(action_values):
+    """Single-pass argmax breaking ties uniformly at random
+
+    One scan keeps the best value seen, the number of ties on it and a
+    reservoir pick replaced with probability 1/n_ties, so ties are resolved
+    without the second pass a max-then-flatnonzero formulation needs. It
+    also removes the first-index bias of np.argmax from the compiled
+    kernels, matching the Python-side _argmax_random helper
+
+    Args:
+      action_values: 1D array of the action-values of a state
+    """
+    best_value = action_values[0]
+    n_ties = 1
+    pick = 0
+    for action in range(1, action_values.shape[0]):
+        value = action_values[action]
+        if value > best_value:
+            best_value = value
+            n_ties = 1
+            pick = action
+        elif value == best_value:
+            n_ties += 1
+            if np.random.random()*n_ties < 1.0:
+                pick = action
+    return pick
+
+@njit(cache=True)
+def sarsa_step(action_value, row, action, reward, next_row, alpha, discount,
+               epsilon, rand_value, rand_action):
+    """Perform one Sarsa update in place and return the sampled next action
+
+    Args:
+      action_value: the (n_states, n_actions) Q-table
+      row (int): row of the state the agent transitioned from
+      action (int): action the agent took in that state
+      reward (float): reward incurred by the transition
+      next_row (int): row of the state the agent transitioned to
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+      epsilon (float): exploration rate of the behavior policy
+      rand_value (float): U(0,1) draw deciding whether to explore
+      rand_action (int): uniformly drawn action index used when exploring
+    """
+    if rand_value < epsilon:
+        next_action = rand_action
+    else:
+        next_action = argmax_random_tie(action_value[next_row])
+    td_error = (reward + discount*action_value[next_row, next_action]
+                - action_value[row, action])
+    action_value[row, action] += alpha*td_error
+    return next_action
+
+@njit(cache=True)
+def expected_sarsa_step(action_value, row, action, reward, next_row, alpha,
+                        discount, epsilon):
+    """Perform one expected Sarsa update in place
+
+    Args:
+      action_value: the (n_states, n_actions) Q-table
+      row (int): row of the state the agent transitioned from
+      action (int): action the agent took in that state
+      reward (float): reward incurred by the transition
+      next_row (int): row of the state the agent transitioned to
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+      epsilon (float): exploration rate of the behavior policy
+    """
+    next_action_values = action_value[next_row]
+    n_actions = next_action_values.shape[0]
+    best_action = np.argmax(next_action_values)
+    expected = 0.0
+    for next_action in range(n_actions):
+        probability = epsilon/n_actions
+        if next_action == best_action:
+            probability += 1-epsilon
+        expected += probability*next_action_values[next_action]
+    td_error = reward + discount*expected - action_value[row, action]
+    action_value[row, action] += alpha*td_error
+
+@njit(cache=True)
+def qlearning_step(action_value, row, action, reward, next_row, alpha,
+                   discount):
+    """Perform one Q-learning update in place
+
+    Args:
+      action_value: the (n_states, n_actions) Q-table
+      row (int): row of the state the agent transitioned from
+      action (int): action the agent took in that state
+      reward (float): reward incurred by the transition
+      next_row (int): row of the state the agent transitioned to
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+    """
+    td_error = (reward + discount*np.max(action_value[next_row])
+                - action_value[row, action])
+    action_value[row, action] += alpha*td_error
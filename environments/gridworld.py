@@ -84,6 +84,24 @@ class GridWorld:
         '+': 5
     }
 
+    # Lookup table indexed by ASCII code implementing the same mapping as
+    # ASCII_TO_INT: converting a whole board becomes a single vectorized
+    # gather instead of a Python-level dict lookup per cell
+    ASCII_LUT = np.zeros(128, dtype=np.int8)
+    for char, value in ASCII_TO_INT.items():
+        ASCII_LUT[ord(char)] = value
+    del char, value
+
+    # Pristine uint8 board of each level, built once at class load; starting
+    # an episode is then a single vectorized copy instead of a nested list
+    # comprehension over the ascii art. np.frombuffer returns a read-only
+    # view, which also protects the layouts from accidental mutation
+    LEVEL_BOARDS = [
+        np.frombuffer(''.join(level['ascii_grid']).encode('ascii'),
+                      dtype=np.uint8).reshape(level['nrows'], level['ncols'])
+        for level in LEVELS
+    ]
+
     class Player(prefab_sprites.MazeWalker):
         """The player
 
@@ -155,9 +173,9 @@ class GridWorld:
         Args:
           level (int): choose one of the preset gridworld layour
           mode: control how the agent state is defined, if set to 'coordinate'
-              the state is defined as a pair of coordinate (x,y), and if set
-              to 'raw' the state is defined a a greyscale image of the
-              gridworld
+              the state is defined as the flat id `row*ncols + col` of the
+              player's position, and if set to 'raw' the state is defined a a
+              greyscale image of the gridworld
           random_stats: if true, the starting position of the agent is drawn
               uniformly at random for the valid starting positions
           random_ops: if true a random number of no-op moves is added to the
@@ -172,10 +190,16 @@ class GridWorld:
         self.random_ops = random_ops
         self.terminal = terminal
         self.timeout = timeout
+        # Width of the level, used to flatten (row, col) positions into the
+        # integer state ids exposed in 'coordinate' mode
+        self._ncols = GridWorld.LEVELS[level]['ncols']
 
         # Internal state used to communicate with the agent and the control
         # algorithm
         self.game = None
+        # Player sprite of the current game, cached to avoid looking it up
+        # in the engine's sprite registry on every step
+        self._player = None
         self.latest_reward = None
         self.episode_reward = None
         self.start_state = None
@@ -183,6 +207,17 @@ class GridWorld:
         self.current_raw_ascii = None
         self.agent_actions = None
         self.agent_states = None
+        # How many rows of the preallocated state/action arrays are filled
+        self._n_states = 0
+        self._n_actions = 0
+
+        # Cached normalized greyscale representation of the gridworld used
+        # in 'raw' mode, along with a snapshot of it from before the latest
+        # move and the normalization statistics of the episode-start layout
+        self._normalized_state = None
+        self._previous_normalized_state = None
+        self._state_mean = None
+        self._state_std = None
 
     def reset(self):
         """Wrapper around 'initialize' and 'start' to setup a new episode"""
@@ -202,26 +237,51 @@ class GridWorld:
             z_order=['A'])
         # Set the timeout so that the player doesn't keep wandering forever
         # in the gridworld
-        self.game._sprites_and_drapes['A'].set_timeout(self.timeout)
+        self._player = self.game._sprites_and_drapes['A']
+        self._player.set_timeout(self.timeout)
 
         # 2D representation of the gridworld
-        self.raw_ascii = [list(row) for row in \
-            GridWorld.LEVELS[self.level]['ascii_grid']]
+        self.raw_ascii = GridWorld.LEVEL_BOARDS[self.level]
         # That variable is updated at each timestep to reflect the position of
-        # the agent in the gridworld and can be used to debug purposes
-        self.current_raw_ascii = self.raw_ascii
+        # the agent in the gridworld and can be used to debug purposes. It has
+        # to be a copy: aliasing the pristine board would corrupt it for the
+        # following episodes
+        self.current_raw_ascii = self.raw_ascii.copy()
+
+        # Normalize the starting layout once per episode; from then on
+        # `_ascii_to_state` returns this cached array and `perform_action`
+        # updates in place the only two cells a move can change, instead of
+        # remapping and renormalizing the whole grid on every step
+        if self.mode != 'coordinate':
+            base_state = GridWorld.ASCII_LUT[self.raw_ascii]
+            self._state_mean = np.mean(base_state)
+            self._state_std = np.std(base_state)
+            self._normalized_state = \
+                (base_state-self._state_mean)/self._state_std
+            # Preallocated snapshot buffer refreshed before every move, so
+            # the previous state survives the in-place cell updates
+            self._previous_normalized_state = self._normalized_state.copy()
 
         # Where did the player start in the gridworld
         if self.mode == 'coordinate':
-            self.start_state = self.game._sprites_and_drapes['A'].position
+            start_row, start_col = self._player.position
+            self.start_state = start_row*self._ncols + start_col
         else:
-            self.start_state = self._ascii_to_state()
-
-        # Keep track of the total reward, of the player's actions and states
-        # so far for diagnostic purposes
+            # A copy, since the cached normalized state mutates as the
+            # player moves while the start state shouldn't
+            self.start_state = self._normalized_state.copy()
+
+        # Keep track of the total reward, of the player's positions and
+        # actions so far for diagnostic purposes. The arrays are preallocated
+        # since the timeout bounds the episode length, so recording a step is
+        # an O(1) row write instead of a Python list append
         self.episode_reward = 0
-        self.agent_actions = []
-        self.agent_states = [self.start_state]
+        self.agent_actions = np.empty(self.timeout+2, dtype=np.int8)
+        self.agent_states = np.empty((self.timeout+2, 2), dtype=np.int16)
+        self.agent_states[0] = \
+            tuple(self._player.position)
+        self._n_states = 1
+        self._n_actions = 0
 
     def start(self):
         """Freeze the gridworld configuration and enter play mode"""
@@ -244,22 +304,27 @@ class GridWorld:
             terminal_ui.play(self.game)
         else:
             _, reward, _ = self.game.its_showtime()
-            self.agent_states.append(self.get_agent_state())
+            self.agent_states[self._n_states] = \
+                tuple(self._player.position)
+            self._n_states += 1
             self.latest_reward = reward
 
     def _ascii_to_state(self):
         """Transforms the current ascii representation of the game state to
         a standardized array of floats
+
+        The array is built once per episode in `initialize` and kept up to
+        date cell by cell in `perform_action`
         """
-        raw_state = [list(map(lambda x: GridWorld.ASCII_TO_INT[x], row) for \
-                     row in self.current_raw_ascii)]
-        return (raw_state-np.mean(raw_state))/np.std(raw_state)
+        return self._normalized_state
 
     def get_agent_state(self):
         """Where is the player in the gridworld"""
         if self.mode == 'coordinate':
-            position = self.game._sprites_and_drapes['A'].position
-            state = tuple(position)
+            # Flattening the position into an integer id lets the tabular
+            # policy index its table directly, with no tuple hashing
+            position = self._player.position
+            state = position[0]*self._ncols + position[1]
         else:
             state = self._ascii_to_state()
         return state
@@ -269,10 +334,13 @@ class GridWorld:
 
         # If the agent has just performed one action or less so far it means
         # one step before it was in the start state
-        if len(self.agent_states) <= 1:
+        if self._n_states <= 1:
             state = self.start_state
+        elif self.mode == 'coordinate':
+            coords = self.agent_states[self._n_states-2]
+            state = int(coords[0])*self._ncols + int(coords[1])
         else:
-            state = self.agent_states[-2]
+            state = self._previous_normalized_state
         return state
 
     def is_episode_over(self):
@@ -286,50 +354,127 @@ class GridWorld:
         Args:
           action: the action received from the agent
         """
-        # We need the previous state to update the ascii representation of the
-        # gridworld after the action is taken
-        previous_x, previous_y = self.get_agent_state()
+        # We need the previous position to update the ascii representation of
+        # the gridworld after the action is taken; read it off the player
+        # sprite directly since in 'raw' mode the agent state is the whole
+        # grid, not a coordinate pair
+        previous_x, previous_y = self._player.position
 
         # Make the game engine update its state according to the action taken
         # by the player
         _, reward, _ = self.game.play(action)
-        current_x, current_y = self.get_agent_state()
+        current_x, current_y = self._player.position
 
         # Update the extra external state the gridworld instance maintains
-        self.agent_actions.append(action)
-        self.agent_states.append(self.get_agent_state())
+        self.agent_actions[self._n_actions] = action
+        self._n_actions += 1
+        self.agent_states[self._n_states] = (current_x, current_y)
+        self._n_states += 1
         self.episode_reward += reward
 
         # Update the raw ascii representation of the gridworld
-        self.current_raw_ascii[previous_x][previous_y] = \
-            self.raw_ascii[previous_x][previous_y]
-        self.current_raw_ascii[current_x][current_y] = 'A'
+        self.current_raw_ascii[previous_x, previous_y] = \
+            self.raw_ascii[previous_x, previous_y]
+        self.current_raw_ascii[current_x, current_y] = ord('A')
+
+        # Keep the cached normalized state in sync by rewriting only the two
+        # cells the move changed, snapshotting it first so that
+        # get_previous_agent_state still sees the pre-move grid
+        if self.mode != 'coordinate':
+            np.copyto(self._previous_normalized_state, self._normalized_state)
+            previous_tile = GridWorld.ASCII_LUT[
+                self.raw_ascii[previous_x, previous_y]]
+            self._normalized_state[previous_x, previous_y] = \
+                (previous_tile-self._state_mean)/self._state_std
+            self._normalized_state[current_x, current_y] = \
+                (GridWorld.ASCII_TO_INT['A']-self._state_mean)/self._state_std
 
         # Store the last reward incurred by the action to the agent
         self.latest_reward = reward
 
     def draw_play(self):
         """Draw as ascii art the path the agent has taken in the episode"""
-        # Start from the ascii representation as it was at the start of the
-        # episode
-        raw_ascii = self.raw_ascii
+        # Stamp the path on a copy of the board as it was at the start of the
+        # episode, so the pristine layout stays intact for later episodes
+        raw_ascii = self.raw_ascii.copy()
 
         # Draw each action the agent took during the episode
-        for state in self.agent_states:
+        for state in self.agent_states[:self._n_states]:
             coord_y, coord_x = state
-            raw_ascii[coord_y][coord_x] = '*'
-        return "\n".join(map(lambda x: ''.join(x), raw_ascii))
+            raw_ascii[coord_y, coord_x] = ord('*')
+        return "\n".join(''.join(map(chr, row)) for row in raw_ascii)
 
     def get_states(self):
         """What are the defined states of the gridworld?"""
         nrows = GridWorld.LEVELS[self.level]['nrows']
         ncols = GridWorld.LEVELS[self.level]['ncols']
         if self.mode == 'coordinate':
-            states = [(i, j) for i in range(nrows) for j in range(ncols)]
+            # The flat ids are consecutive integers, so a range covers them
+            # without materializing nrows*ncols objects
+            states = range(nrows*ncols)
         else:
             states = np.zeros((nrows, ncols))
         return states
 
+    # Cache of the dense transition/reward tables per level, shared across
+    # instances since the dynamics only depend on the layout
+    _TRANSITIONS_CACHE = {}
+
+    def get_start_state(self):
+        """Flat id of the player's starting position on the pristine board"""
+        board = GridWorld.LEVEL_BOARDS[self.level]
+        start_row, start_col = np.argwhere(board == ord('A'))[0]
+        return int(start_row)*self._ncols + int(start_col)
+
+    def get_transition_arrays(self):
+        """Dense dynamics of the level as a pair of arrays
+
+        Returns (transitions, rewards) where `transitions[s, a]` is the flat
+        id of the state reached by taking action `a` in state `s` and
+        `rewards[s, a]` the reward incurred by the move. The gridworld is
+        deterministic, so the tables capture it exactly: walls block moves,
+        windy tiles push westward, every move costs -1 except reaching the
+        goal, and goal tiles are absorbing. Built once per level
+        """
+        if self.level in GridWorld._TRANSITIONS_CACHE:
+            return GridWorld._TRANSITIONS_CACHE[self.level]
+
+        board = GridWorld.LEVEL_BOARDS[self.level]
+        nrows, ncols = board.shape
+        wall, goal = ord('#'), ord('G')
+        windy, very_windy = ord('.'), ord('+')
+        moves = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+        transitions = np.empty((nrows*ncols, len(moves)), dtype=np.int64)
+        rewards = np.empty((nrows*ncols, len(moves)), dtype=np.float32)
+        for row in range(nrows):
+            for col in range(ncols):
+                state = row*ncols + col
+                for action, (d_row, d_col) in enumerate(moves):
+                    if board[row, col] == goal:
+                        transitions[state, action] = state
+                        rewards[state, action] = 0.0
+                        continue
+                    new_row, new_col = row+d_row, col+d_col
+                    if not (0 <= new_row < nrows and 0 <= new_col < ncols) \
+                       or board[new_row, new_col] == wall:
+                        new_row, new_col = row, col
+                    # Wind pushes westward once per move, by one or two
+                    # tiles, each push being blocked by walls
+                    if board[new_row, new_col] == windy:
+                        if board[new_row, new_col-1] != wall:
+                            new_col -= 1
+                    elif board[new_row, new_col] == very_windy:
+                        for _ in range(2):
+                            if board[new_row, new_col-1] != wall:
+                                new_col -= 1
+                    transitions[state, action] = new_row*ncols + new_col
+                    rewards[state, action] = \
+                        0.0 if board[new_row, new_col] == goal else -1.0
+
+        GridWorld._TRANSITIONS_CACHE[self.level] = (transitions, rewards)
+        return transitions, rewards
+
     def get_actions(self):
         """What are the actions the player can take in the gridworld?"""
         return GridWorld.LEVELS[self.level]['actions']
@@ -346,4 +491,4 @@ class GridWorld:
 
     def get_latest_action(self):
         """What was the latest action the agent performed?"""
-        return self.agent_actions[-1]
+        return int(self.agent_actions[self._n_actions-1])
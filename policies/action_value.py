@@ -1,12 +1,28 @@
 """Action-value function to implement the agent's behavior policy"""
-from operator import add
 import numpy as np
 
+def _argmax_random(action_values, rng):
+    """Index of the maximum action-value, breaking ties uniformly at random
+
+    np.argmax always returns the first maximal index, which biases the greedy
+    policy towards low-numbered actions whenever several action-values are
+    tied, e.g. at the start of training when the whole table is zero
+
+    Args:
+      action_values: 1D array of action-values for a given state
+      rng: numpy random generator used to break the ties
+    """
+    ties = np.flatnonzero(action_values == action_values.max())
+    if ties.size == 1:
+        return ties[0]
+    return rng.choice(ties)
+
+
 class ActionValue:
     """Action value function `Q`, where `Q(s,a)` is the expected discounted return
     of taking action `a` in state `s`
     """
-    def __init__(self, states, actions, epsilon=0.1, double=False):
+    def __init__(self, states, actions, epsilon=0.1, double=False, seed=None):
         """Initialize an action-value function
 
         Args:
@@ -15,10 +31,13 @@ class ActionValue:
           epsilon (float): controls how greedy the policy is:
               if a U(0,1) is < epsilon, then choose an action unformly at random
               otherwise, choose the action which maximizes the action-value
+          seed: optional seed of the policy's random generator, making the
+              epsilon-greedy draws and argmax tie-breaks reproducible
         """
         self.actions = actions
         self.states = states
         self.epsilon = epsilon
+        self.seed = seed
 
         # When using TD control methods such as Qlearning where one tries to
         # approximate the optimal action-value function by solving iteratively
@@ -31,9 +50,14 @@ class ActionValue:
         # the other to update its action-value
         self.double = double
 
-        # Flag controlling which action-value function estimate to use for
-        # finding the greedy action
-        self.flag = 0
+    def reseed(self, seed):
+        """Reset the policy's random generator to a known seed
+
+        Args:
+          seed: seed of the fresh generator
+        """
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
 
     def get_action_value(self, state, action):
         """Get the action-value of a given (state, action) pair
@@ -118,30 +142,82 @@ class ActionValue:
         Raises:
           ValueError: if requesting the action-value of an action which cannot
               be taken in the state
+
+        The check only runs in debug mode: it sits on the per-step hot path
+        and costs more than the table lookup it guards, so production
+        training can strip it with `python -O`
         """
-        if action < 0 or action >= len(self.actions):
-            raise ValueError("Action {0} cannot be taken in state {1}"
-                             .format(action, state))
+        if __debug__:
+            if action < 0 or action >= len(self.actions):
+                raise ValueError("Action {0} cannot be taken in state {1}"
+                                 .format(action, state))
 
 
 class TabularActionValue(ActionValue):
     """Tabular action-value function: finite number of (action-state) pairs"""
+    def __new__(cls, *args, **kwargs):
+        # Dispatch to the variant whose hot-path reductions are unrolled for
+        # exactly four actions, which is what the gridworld exposes
+        if cls is TabularActionValue:
+            actions = args[1] if len(args) > 1 else kwargs.get('actions')
+            if actions is not None and len(actions) == 4:
+                return super().__new__(TabularActionValue4)
+        return super().__new__(cls)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.double:
             self.name = 'double_tabular'
         else:
             self.name = 'simple_tabular'
-        # The action-value function in this case is represented as a dict whose
-        # keys are the states and whose values are arrays where at index `i`
-        # is stored the expected discounted return of taking the ith action in
-        # the keyed state
-        self.tabular_action_value = {state: [0]*len(self.actions) for state \
-                                     in self.states}
-
-        # The auxiliary action-value function used to avoid maximization bias
-        self.auxiliary_tabular_action_value = {state: [0]*len(self.actions) \
-                                               for state in self.states}
+        # The action-value function in this case is represented as a single
+        # contiguous 2D array of shape (n_states, n_actions) where at row `i`
+        # and column `j` is stored the expected discounted return of taking
+        # the jth action in the ith state. Keeping the table contiguous lets
+        # the per-step max/argmax reductions run over raw memory instead of
+        # rebuilding an array from a Python list on every call.
+        # When the states already are the integers 0..S-1, e.g. the flat ids
+        # the gridworld exposes in coordinate mode, the state itself indexes
+        # the table and the state-to-row dict (and its per-step hash lookup)
+        # is unnecessary
+        if isinstance(self.states, range) and self.states.start == 0 \
+           and self.states.step == 1:
+            self._state_index = None
+            n_states = len(self.states)
+        else:
+            self._state_index = {state: row for row, state in \
+                                 enumerate(self.states)}
+            n_states = len(self._state_index)
+        self._n_actions = len(self.actions)
+        # In double mode both estimates, used to avoid maximization bias,
+        # live in one (2, n_states, n_actions) array: the estimate each
+        # update writes to is drawn uniformly at random, the canonical
+        # double-Q formulation, instead of the deterministic alternation
+        # the old per-call flag branch implemented
+        # float32 halves the bytes moved per Q-row read/modify/write and
+        # carries ample precision for unit-scale rewards and discounts <= 1
+        if self.double:
+            self.tabular_action_value = np.zeros(
+                (2, n_states, self._n_actions), dtype=np.float32)
+        else:
+            self.tabular_action_value = np.zeros(
+                (n_states, self._n_actions), dtype=np.float32)
+        # Index of the estimate the current update writes to; redrawn after
+        # every update, which is distributionally the same as drawing it at
+        # the start of the update and keeps one update's reads consistent
+        self._which = 0
+
+        # Probability of each action under the epsilon-greedy policy before
+        # accounting for the greedy action, precomputed once so that the
+        # expected action-value reduces to a single dot product per call
+        self._base_probs = np.full(self._n_actions,
+                                   self.epsilon/self._n_actions,
+                                   dtype=np.float32)
+
+        # Cached generator used for the epsilon-greedy draws and to break
+        # argmax ties; a per-instance generator also skips the locking of
+        # numpy's global random state
+        self._rng = np.random.default_rng(self.seed)
 
     def _validate_state(self, state):
         """Check that the state is a defined state of the environment
@@ -152,72 +228,299 @@ class TabularActionValue(ActionValue):
         Raises:
           ValueError: if requesting a state which is not one of the defined
               states of the environment
+
+        The check only runs in debug mode: it sits on the per-step hot path
+        and costs more than the table lookup it guards, so production
+        training can strip it with `python -O`
+        """
+        if __debug__:
+            if self._state_index is None:
+                # The state axis is the second to last one, since double
+                # mode stacks the two estimates in front of it
+                if not 0 <= state < self.tabular_action_value.shape[-2]:
+                    raise ValueError(
+                        "State {0} is not defined in the environment"
+                        .format(state))
+            elif not state in self._state_index:
+                raise ValueError("State {0} is not defined in the environment"
+                                 .format(state))
+
+    def _state_row(self, state):
+        """Row of the table holding the action-values of a given state
+
+        Args:
+          state: one of the defined states of the environment
         """
-        if not state in self.tabular_action_value:
-            raise ValueError("State {0} is not defined in the environment")
+        if self._state_index is None:
+            return state
+        return self._state_index[state]
 
     def get_action_value(self, state, action):
         self._validate_state(state)
         self._validate_action(state, action)
 
-        if not self.double or self.flag == 0:
-            value = self.tabular_action_value[state][action]
+        row = self._state_row(state)
+        if self.double:
+            value = self.tabular_action_value[self._which, row, action]
         else:
-            value = self.auxiliary_tabular_action_value[state][action]
+            value = self.tabular_action_value[row, action]
         return value
 
     def update_action_value(self, state, action, update):
         self._validate_state(state)
         self._validate_action(state, action)
 
-        if not self.double or self.flag == 0:
-            self.tabular_action_value[state][action] += update
-            self.flag = 1
+        row = self._state_row(state)
+        if self.double:
+            self.tabular_action_value[self._which, row, action] += update
+            self._which = int(self._rng.integers(2))
         else:
-            self.auxiliary_tabular_action_value[state][action] += update
-            self.flag = 0
+            self.tabular_action_value[row, action] += update
 
     def choose_next_action(self, state, greedy=False):
         self._validate_state(state)
-        if not greedy and np.random.rand() < self.epsilon:
-            action = np.random.choice(self.actions)
+        if not greedy and self._rng.random() < self.epsilon:
+            # The actions are a plain range, so drawing an index directly
+            # avoids the list-to-array conversion np.random.choice would do
+            action = int(self._rng.integers(self._n_actions))
         else:
+            row = self._state_row(state)
             if self.double:
-                # This inner map is potentially executed on each iteration of
-                # the learning phase. However, most of the time, it's a constant
+                # This sum is potentially executed on each iteration of the
+                # learning phase. However, most of the time, it's a constant
                 # time operation since in most games there are usually less than
                 # a few tens possible moves
-                avg_action_value = map(add, self.tabular_action_value[state],
-                                       self.auxiliary_tabular_action_value[state])
-                action = np.argmax(list(avg_action_value))
+                avg_action_value = (self.tabular_action_value[0, row]
+                                    + self.tabular_action_value[1, row])
+                action = _argmax_random(avg_action_value, self._rng)
             else:
-                action = np.argmax(self.tabular_action_value[state])
+                action = _argmax_random(self.tabular_action_value[row],
+                                        self._rng)
         return action
 
     def get_expected_action_value(self, state):
         self._validate_state(state)
 
-        if self.double and self.flag == 0:
-            action_value_function = self.auxiliary_tabular_action_value
+        row = self._state_row(state)
+        if self.double:
+            # Greedy action from the estimate being updated, evaluation of
+            # the probabilities against the other one
+            action_values = self.tabular_action_value[1-self._which, row]
+            best_action = self.tabular_action_value[self._which, row].argmax()
         else:
-            action_value_function = self.tabular_action_value
-
-        best_action = np.argmax(action_value_function[state])
-        expected_next_action_value = 0
-        for action, action_value in enumerate(action_value_function[state]):
-            if action == best_action:
-                multiplier = 1-self.epsilon*(1-1.0/len(self.actions))
-                expected_next_action_value += action_value*multiplier
-            else:
-                multiplier = self.epsilon*1.0/len(self.actions)
-                expected_next_action_value += action_value*multiplier
-        return expected_next_action_value
+            action_values = self.tabular_action_value[row]
+            best_action = action_values.argmax()
+        # The greedy action gets the whole 1-epsilon probability mass on top
+        # of its share of the uniform exploration mass
+        probs = self._base_probs.copy()
+        probs[best_action] += 1-self.epsilon
+        return float(probs @ action_values)
 
     def get_best_action_value(self, state):
         self._validate_state(state)
 
-        if self.double and self.flag == 0:
-            value = np.max(self.auxiliary_tabular_action_value[state])
+        row = self._state_row(state)
+        if self.double:
+            # Greedy action from the estimate being updated, evaluated on
+            # the other one
+            best_action = self.tabular_action_value[self._which, row].argmax()
+            value = self.tabular_action_value[1-self._which, row, best_action]
         else:
-            value = np.max(self.tabular_action_value[state])
+            value = self.tabular_action_value[row].max()
         return value
+
+
+class TabularActionValue4(TabularActionValue):
+    """Tabular action-value function specialized for exactly four actions
+
+    With the action count known at definition time the per-step argmax, max
+    and expectation unroll into a handful of scalar compares over one row,
+    avoiding the generic reduction machinery. `TabularActionValue` selects
+    this class automatically when `len(actions) == 4`
+    """
+    @staticmethod
+    def _argmax4(action_values, rng):
+        """Unrolled four-way argmax, falling back to random tie-breaking
+        only when the maximum is not unique
+
+        Args:
+          action_values: 1D array of the four action-values of a state
+          rng: numpy random generator used to break the ties
+        """
+        value_0 = action_values[0]
+        value_1 = action_values[1]
+        value_2 = action_values[2]
+        value_3 = action_values[3]
+        first = 0 if value_0 >= value_1 else 1
+        second = 2 if value_2 >= value_3 else 3
+        best = first if action_values[first] >= action_values[second] \
+               else second
+        best_value = action_values[best]
+        ties = ((value_0 == best_value) + (value_1 == best_value)
+                + (value_2 == best_value) + (value_3 == best_value))
+        if ties > 1:
+            return _argmax_random(action_values, rng)
+        return best
+
+    def choose_next_action(self, state, greedy=False):
+        self._validate_state(state)
+        if not greedy and self._rng.random() < self.epsilon:
+            return int(self._rng.integers(4))
+
+        row = self._state_row(state)
+        if self.double:
+            action_values = (self.tabular_action_value[0, row]
+                             + self.tabular_action_value[1, row])
+        else:
+            action_values = self.tabular_action_value[row]
+        return self._argmax4(action_values, self._rng)
+
+    def _greedy_and_eval_rows(self, state):
+        """Pair of rows the greedy action is chosen from and evaluated on
+
+        In double mode the greedy action comes from the estimate being
+        updated while its value is read off the other one; in single mode
+        both are the same row
+
+        Args:
+          state: one of the defined states of the environment
+        """
+        row = self._state_row(state)
+        if self.double:
+            return (self.tabular_action_value[self._which, row],
+                    self.tabular_action_value[1-self._which, row])
+        action_values = self.tabular_action_value[row]
+        return action_values, action_values
+
+    @staticmethod
+    def _best4(greedy_values):
+        """Unrolled four-way argmax without tie-breaking, for contexts where
+        which of the tied actions wins does not change the result
+
+        Args:
+          greedy_values: 1D array of the four action-values of a state
+        """
+        first = 0 if greedy_values[0] >= greedy_values[1] else 1
+        second = 2 if greedy_values[2] >= greedy_values[3] else 3
+        return first if greedy_values[first] >= greedy_values[second] \
+               else second
+
+    def get_expected_action_value(self, state):
+        self._validate_state(state)
+
+        greedy_values, action_values = self._greedy_and_eval_rows(state)
+        best = self._best4(greedy_values)
+        # The expectation under the epsilon-greedy policy collapses to the
+        # greedy value plus the uniform exploration mass over the row
+        return ((1-self.epsilon)*action_values[best]
+                + self.epsilon*0.25*(action_values[0]+action_values[1]
+                                     +action_values[2]+action_values[3]))
+
+    def get_best_action_value(self, state):
+        self._validate_state(state)
+
+        greedy_values, action_values = self._greedy_and_eval_rows(state)
+        return action_values[self._best4(greedy_values)]
+
+
+class SparseTabularActionValue(ActionValue):
+    """Tabular action-value function backed by lazily allocated rows
+
+    'raw' mode states are normalized float grids: they are not hashable and
+    enumerating every one of them up front, as the dense table does, would
+    blow up memory on state spaces where only a tiny fraction of states is
+    ever visited. Key the rows by the byte content of the state array
+    instead and allocate a fresh zero row the first time a state is seen,
+    so storage grows with the states actually encountered
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.double:
+            self.name = 'double_sparse_tabular'
+        else:
+            self.name = 'sparse_tabular'
+        self._n_actions = len(self.actions)
+        # Visited-state rows keyed by the state bytes; each row is an
+        # (n_actions,) float32 array, or (2, n_actions) in double mode
+        self._rows = {}
+
+        # Same per-instance machinery as the dense table: exploration mass
+        # vector for the expectation dot product and a cached generator
+        self._base_probs = np.full(self._n_actions,
+                                   self.epsilon/self._n_actions,
+                                   dtype=np.float32)
+        self._rng = np.random.default_rng(self.seed)
+        self._which = 0
+
+    @staticmethod
+    def _state_key(state):
+        """Hashable key of a state: the raw bytes for arrays, the state
+        itself for anything already hashable
+
+        Args:
+          state: one of the states of the environment
+        """
+        if isinstance(state, np.ndarray):
+            return state.tobytes()
+        return state
+
+    def _state_row(self, state):
+        """Action-value row of a state, allocated on first visit
+
+        Args:
+          state: one of the states of the environment
+        """
+        key = self._state_key(state)
+        row = self._rows.get(key)
+        if row is None:
+            if self.double:
+                row = np.zeros((2, self._n_actions), dtype=np.float32)
+            else:
+                row = np.zeros(self._n_actions, dtype=np.float32)
+            self._rows[key] = row
+        return row
+
+    def get_action_value(self, state, action):
+        self._validate_action(state, action)
+
+        row = self._state_row(state)
+        if self.double:
+            return row[self._which, action]
+        return row[action]
+
+    def update_action_value(self, state, action, update):
+        self._validate_action(state, action)
+
+        row = self._state_row(state)
+        if self.double:
+            row[self._which, action] += update
+            self._which = int(self._rng.integers(2))
+        else:
+            row[action] += update
+
+    def choose_next_action(self, state, greedy=False):
+        if not greedy and self._rng.random() < self.epsilon:
+            return int(self._rng.integers(self._n_actions))
+
+        row = self._state_row(state)
+        if self.double:
+            return _argmax_random(row[0] + row[1], self._rng)
+        return _argmax_random(row, self._rng)
+
+    def get_expected_action_value(self, state):
+        row = self._state_row(state)
+        if self.double:
+            action_values = row[1-self._which]
+            best_action = row[self._which].argmax()
+        else:
+            action_values = row
+            best_action = row.argmax()
+        probs = self._base_probs.copy()
+        probs[best_action] += 1-self.epsilon
+        return float(probs @ action_values)
+
+    def get_best_action_value(self, state):
+        row = self._state_row(state)
+        if self.double:
+            return row[1-self._which, row[self._which].argmax()]
+        return row.max()
@@ -0,0 +1,167 @@
+"""Fused compiled training of several control algorithms at once
+
+Training a handful of controls on the same level is a batch of independent
+tabular TD runs. Stacking their Q-tables and driving every episode from one
+njit function removes the Python dispatch entirely and lets prange spread
+the controls across cores; the dense dynamics tables come from
+GridWorld.get_transition_arrays
+"""
+import numpy as np
+from numba import njit, prange
+
+from controls.control_numba import argmax_random_tie
+from utils.runner import CONTROL_CODES
+
+@njit(cache=True)
+def _choose_action(action_values, epsilon):
+    """Sample an action for a Q-row under the epsilon-greedy policy
+
+    Args:
+      action_values: 1D array of the action-values of a state
+      epsilon (float): exploration rate of the behavior policy
+    """
+    if np.random.random() < epsilon:
+        return np.random.randint(0, action_values.shape[0])
+    return argmax_random_tie(action_values)
+
+@njit(cache=True)
+def _train_control(transitions, rewards, action_value, start_state, alpha,
+                   discount, epsilon, n_episodes, max_steps, control,
+                   episode_rewards):
+    """Train one control's Q-table in place for a full run of episodes
+
+    Args:
+      transitions: (n_states, n_actions) next-state table of the level
+      rewards: (n_states, n_actions) reward table of the level
+      action_value: (n_states, n_actions) Q-table of this control
+      start_state (int): flat id of the episode starting state
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+      epsilon (float): exploration rate of the behavior policy
+      n_episodes (int): how many episodes the run lasts
+      max_steps (int): maximum number of moves per episode
+      control (int): update rule, one of the CONTROL_CODES values
+      episode_rewards: (n_episodes,) output buffer of episode rewards
+    """
+    n_actions = action_value.shape[1]
+    for episode in range(n_episodes):
+        state = start_state
+        action = _choose_action(action_value[state], epsilon)
+        total_reward = 0.0
+        for _ in range(max_steps):
+            next_state = transitions[state, action]
+            reward = rewards[state, action]
+            total_reward += reward
+
+            next_action = _choose_action(action_value[next_state], epsilon)
+            if control == 0:
+                bootstrap = action_value[next_state, next_action]
+            elif control == 1:
+                bootstrap = np.max(action_value[next_state])
+            else:
+                next_values = action_value[next_state]
+                best = np.argmax(next_values)
+                bootstrap = 0.0
+                for other in range(n_actions):
+                    probability = epsilon/n_actions
+                    if other == best:
+                        probability += 1-epsilon
+                    bootstrap += probability*next_values[other]
+            action_value[state, action] += \
+                alpha*(reward + discount*bootstrap
+                       - action_value[state, action])
+
+            # Only reaching the goal yields a zero reward, so it doubles as
+            # the termination signal
+            if reward == 0:
+                break
+            state = next_state
+            action = next_action
+        episode_rewards[episode] = total_reward
+
+@njit(cache=True, parallel=True)
+def train_all(transitions, rewards, action_values, start_state, alphas,
+              discounts, epsilons, n_episodes, max_steps, control_codes,
+              seeds):
+    """Train every stacked Q-table in parallel and return the per-control
+    episode rewards
+
+    Args:
+      transitions: (n_states, n_actions) next-state table of the level
+      rewards: (n_states, n_actions) reward table of the level
+      action_values: (n_controls, n_states, n_actions) stacked Q-tables
+      start_state (int): flat id of the episode starting state
+      alphas: (n_controls,) learning rates
+      discounts: (n_controls,) discount rates
+      epsilons: (n_controls,) exploration rates
+      n_episodes (int): how many episodes each run lasts
+      max_steps (int): maximum number of moves per episode
+      control_codes: (n_controls,) update rules, CONTROL_CODES values
+      seeds: (n_controls,) per-control random seeds
+    """
+    n_controls = action_values.shape[0]
+    episode_rewards = np.empty((n_controls, n_episodes))
+    for control in prange(n_controls):
+        np.random.seed(seeds[control])
+        _train_control(transitions, rewards, action_values[control],
+                       start_state, alphas[control], discounts[control],
+                       epsilons[control], n_episodes, max_steps,
+                       control_codes[control], episode_rewards[control])
+    return episode_rewards
+
+def train_fused(trainings, seeds=None):
+    """Run several Train instances through one compiled parallel call
+
+    Every training must share the environment and episode count, use a
+    non-double tabular action-value and one of the built-in controls. The
+    learned tables and per-episode rewards are written back into each
+    training, so downstream consumers such as the comparator see exactly
+    what the Python loop would have produced
+
+    Args:
+      trainings: Train instances to run
+      seeds: optional per-training random seeds; the trainings' own seeds
+          when every one carries one, 0..n-1 otherwise
+
+    Raises:
+      ValueError: if a training doesn't fit the fused kernel, which would
+          otherwise misindex the stacked tables inside compiled code
+          without raising
+    """
+    for training in trainings:
+        if training.agent.action_value.name != 'simple_tabular':
+            raise ValueError(
+                "Cannot fuse a training over a {0} action-value: the kernel "
+                "operates on non-double tabular Q-tables"
+                .format(training.agent.action_value.name))
+    if any(training.episodes != trainings[0].episodes
+           for training in trainings):
+        raise ValueError(
+            "Cannot fuse trainings with different episode counts")
+
+    environment = trainings[0].environment
+    transitions, rewards = environment.get_transition_arrays()
+    if seeds is None:
+        seeds = [training.seed for training in trainings]
+        if any(seed is None for seed in seeds):
+            seeds = np.arange(len(trainings))
+
+    action_values = np.stack([training.agent.action_value.tabular_action_value
+                              for training in trainings])
+    episode_rewards = train_all(
+        transitions, rewards, action_values, environment.get_start_state(),
+        np.array([training.control.alpha for training in trainings]),
+        np.array([training.control.discount for training in trainings]),
+        np.array([0.0 if training.agent.greedy
+                  else training.agent.action_value.epsilon
+                  for training in trainings]),
+        trainings[0].episodes, environment.timeout,
+        np.array([CONTROL_CODES[training.control.name]
+                  for training in trainings]),
+        np.asarray(seeds))
+
+    for index, training in enumerate(trainings):
+        training.episode_rewards[:] = episode_rewards[index]
+        training.agent.action_value.tabular_action_value[:] = \
+            action_values[index]
+    return trainings
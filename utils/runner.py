@@ -0,0 +1,176 @@
+"""Run many independent training runs in parallel with compiled kernels
+
+Averaging tabular RL experiments over independent seeds is embarrassingly
+parallel, but the Pycolab-backed environment keeps each run on the Python
+interpreter. The gridworld dynamics are simple enough, a static board with
+deterministic moves and westward wind, to re-express directly on the
+pristine uint8 boards, which lets a whole experiment sweep compile under
+numba and scale across cores with prange
+"""
+import numpy as np
+from numba import njit, prange
+
+from environments.gridworld import GridWorld
+from controls.control_numba import argmax_random_tie
+
+# ASCII codes of the tiles the compiled dynamics care about, matching the
+# schematic representation documented on GridWorld
+WALL = ord('#')
+GOAL = ord('G')
+WINDY = ord('.')
+VERY_WINDY = ord('+')
+
+# Integer codes selecting the update rule inside the compiled episode loop
+CONTROL_CODES = {'sarsa': 0, 'qlearning': 1, 'expected_sarsa': 2}
+
+@njit(cache=True)
+def _move(board, row, col, action):
+    """Apply one action to a player position, reproducing the gridworld
+    rules: walls block moves and windy tiles push the player westward
+
+    Args:
+      board: pristine uint8 board of the level
+      row (int): current row of the player
+      col (int): current column of the player
+      action (int): 0 north, 1 south, 2 west, 3 east
+    """
+    new_row, new_col = row, col
+    if action == 0:
+        new_row -= 1
+    elif action == 1:
+        new_row += 1
+    elif action == 2:
+        new_col -= 1
+    else:
+        new_col += 1
+    if board[new_row, new_col] == WALL:
+        new_row, new_col = row, col
+
+    # Wind pushes westward once per move, by one or two tiles, each push
+    # being blocked by walls just like a regular move
+    if board[new_row, new_col] == WINDY:
+        if board[new_row, new_col-1] != WALL:
+            new_col -= 1
+    elif board[new_row, new_col] == VERY_WINDY:
+        for _ in range(2):
+            if board[new_row, new_col-1] != WALL:
+                new_col -= 1
+    return new_row, new_col
+
+@njit(cache=True)
+def _run_episode(board, action_value, start_row, start_col, epsilon, alpha,
+                 discount, timeout, control):
+    """Run one episode updating the Q-table in place and return the episode
+    reward
+
+    Args:
+      board: pristine uint8 board of the level
+      action_value: (n_states, 4) Q-table of this run
+      start_row (int): starting row of the player
+      start_col (int): starting column of the player
+      epsilon (float): exploration rate of the behavior policy
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+      timeout (int): maximum number of moves in the episode
+      control (int): update rule, one of the CONTROL_CODES values
+    """
+    ncols = board.shape[1]
+    row, col = start_row, start_col
+    state = row*ncols + col
+    episode_reward = 0.0
+
+    if np.random.random() < epsilon:
+        action = np.random.randint(0, 4)
+    else:
+        action = argmax_random_tie(action_value[state])
+
+    for _ in range(timeout):
+        row, col = _move(board, row, col, action)
+        next_state = row*ncols + col
+        done = board[row, col] == GOAL
+        reward = 0.0 if done else -1.0
+        episode_reward += reward
+
+        if np.random.random() < epsilon:
+            next_action = np.random.randint(0, 4)
+        else:
+            next_action = argmax_random_tie(action_value[next_state])
+
+        if control == 0:
+            target = reward + discount*action_value[next_state, next_action]
+        elif control == 1:
+            target = reward + discount*np.max(action_value[next_state])
+        else:
+            next_values = action_value[next_state]
+            best = np.argmax(next_values)
+            expected = 0.0
+            for other in range(4):
+                probability = epsilon/4
+                if other == best:
+                    probability += 1-epsilon
+                expected += probability*next_values[other]
+            target = reward + discount*expected
+        action_value[state, action] += \
+            alpha*(target - action_value[state, action])
+
+        if done:
+            break
+        state = next_state
+        action = next_action
+    return episode_reward
+
+@njit(parallel=True, cache=True)
+def run_episodes(board, start_row, start_col, n_seeds, n_episodes, epsilon,
+                 alpha, discount, timeout, control):
+    """Train one independent Q-table per seed, with the seeds spread across
+    CPU cores
+
+    Returns the (n_seeds, n_episodes) array of episode rewards and the
+    (n_seeds, n_states, 4) array of learned Q-tables
+
+    Args:
+      board: pristine uint8 board of the level
+      start_row (int): starting row of the player
+      start_col (int): starting column of the player
+      n_seeds (int): how many independent runs to train
+      n_episodes (int): how many episodes each run lasts
+      epsilon (float): exploration rate of the behavior policy
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+      timeout (int): maximum number of moves per episode
+      control (int): update rule, one of the CONTROL_CODES values
+    """
+    n_states = board.shape[0]*board.shape[1]
+    episode_rewards = np.empty((n_seeds, n_episodes))
+    action_values = np.zeros((n_seeds, n_states, 4), dtype=np.float32)
+    for seed in prange(n_seeds):
+        np.random.seed(seed)
+        for episode in range(n_episodes):
+            episode_rewards[seed, episode] = _run_episode(
+                board, action_values[seed], start_row, start_col, epsilon,
+                alpha, discount, timeout, control)
+    return episode_rewards, action_values
+
+def run_parallel_trainings(level=0, control='qlearning', n_seeds=8,
+                           n_episodes=1000, epsilon=0.1, alpha=0.5,
+                           discount=1.0, timeout=60):
+    """Train many independent agents on a gridworld level in parallel
+
+    Thin wrapper around the compiled sweep: resolves the level board and
+    the player's starting position, then hands everything to run_episodes
+
+    Args:
+      level (int): choose one of the preset gridworld layouts
+      control: name of the update rule, a key of CONTROL_CODES
+      n_seeds (int): how many independent runs to train
+      n_episodes (int): how many episodes each run lasts
+      epsilon (float): exploration rate of the behavior policy
+      alpha (float): learning rate of the control algorithm
+      discount (float): discount rate of the return
+      timeout (int): maximum number of moves per episode
+    """
+    board = GridWorld.LEVEL_BOARDS[level]
+    start_row, start_col = np.argwhere(board == ord('A'))[0]
+    return run_episodes(board, start_row, start_col, n_seeds, n_episodes,
+                        epsilon, alpha, discount, timeout,
+                        CONTROL_CODES[control])
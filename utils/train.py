@@ -2,11 +2,27 @@
 method
 """
 
+from dataclasses import dataclass
+
+import numpy as np
+
+@dataclass
+class TrainingResult:
+    """Lightweight summary of a finished training
+
+    Holds just what the comparator needs, so it pickles across process
+    boundaries as a few kilobytes instead of dragging the whole
+    agent/environment graph along
+    """
+    episode_rewards: np.ndarray
+    control_name: str
+    action_value_name: str
+
 class Train:
     """Train the agent's policy to maximize its reward in an episodic
     environment
     """
-    def __init__(self, agent, environment, control, episodes=1000):
+    def __init__(self, agent, environment, control, episodes=1000, seed=None):
         """Initialize the training algorithm
 
         Args:
@@ -14,26 +30,119 @@ class Train:
           environment: environment in which the agent evolves
           control: generalized policy iteration algorithm
           episodes: how many episodes should we train the agent on?
+          seed: optional seed making the run reproducible; it reseeds the
+              agent's behavior policy and is picked up by the fused
+              compiled trainer
         """
         self.agent = agent
         self.environment = environment
         self.control = control
         self.episodes = episodes
-        # Keep track of the per episode return for diagnostic purposes
-        self.episode_rewards = []
+        self.seed = seed
+        if seed is not None:
+            agent.action_value.reseed(seed)
+        # Keep track of the per episode return for diagnostic purposes; the
+        # episode count is known up front, so the buffer is preallocated and
+        # filled by index rather than grown by append
+        self.episode_rewards = np.empty(episodes)
+        # Bind the methods the generic episode loop calls on every step
+        # once, saving their attribute lookups in the hot loop
+        self._step_act = agent.act_once
+        self._step_update = control.update
+        self._is_over = environment.is_episode_over
+        self._get_reward = environment.get_episode_reward
 
-    def train(self):
+    def train(self, progress=False, report_every=50, callback=None):
         """Run the agent in the environment for each episode and improve its
         policy
+
+        The loop itself stays free of per-episode printing or progress-bar
+        updates, whose I/O would dominate the short gridworld episodes;
+        diagnostics go through an optional callback invoked every
+        report_every episodes instead
+
+        Args:
+          progress: report training progress through the callback?
+          report_every (int): how many episodes between two reports
+          callback: called with the episode count and the rewards gathered
+              so far, as callback(episode, episode_rewards)
         """
-        for _ in range(self.episodes):
-            episode_reward = self.run_episode()
-            self.episode_rewards.append(episode_reward)
+        for episode in range(self.episodes):
+            self.episode_rewards[episode] = self.run_episode()
+            if progress and callback and (episode + 1) % report_every == 0:
+                callback(episode + 1, self.episode_rewards[:episode + 1])
+
+    def result(self):
+        """Condense the training into a picklable TrainingResult"""
+        return TrainingResult(self.episode_rewards, self.control.name,
+                              self.agent.action_value.name)
 
     def run_episode(self):
         """Run one episode of the environment"""
+        if self._can_run_on_arrays():
+            return self._run_episode_on_arrays()
+
         self.environment.reset()
-        while not self.environment.is_episode_over():
-            self.agent.act_once()
-            self.control.update(self.agent, self.environment)
-        return self.environment.get_episode_reward()
+        act, update, is_over = \
+            self._step_act, self._step_update, self._is_over
+        agent, environment = self.agent, self.environment
+        while not is_over():
+            act()
+            update(agent, environment)
+        return self._get_reward()
+
+    def _can_run_on_arrays(self):
+        """Can the episode run on the environment's dense dynamics tables?
+
+        The array rollout needs a deterministic environment advertising
+        get_transition_arrays, a non-double tabular action-value indexed by
+        flat state ids, and one of the built-in TD control rules
+        """
+        return (self.agent.action_value.name == 'simple_tabular'
+                and hasattr(self.environment, 'get_transition_arrays')
+                and self.control.name in ('sarsa', 'qlearning',
+                                          'expected_sarsa'))
+
+    def _run_episode_on_arrays(self):
+        """Run one episode directly on the dense transition/reward tables
+
+        The generic loop crosses the game engine and several agent/policy
+        methods on every step; here a step is a pair of array lookups plus
+        the in-place TD update, with the behavior policy still sampled from
+        the agent's action-value function
+        """
+        environment = self.environment
+        transitions, rewards = environment.get_transition_arrays()
+        action_value = self.agent.action_value
+        table = action_value.tabular_action_value
+        greedy = self.agent.greedy
+        alpha = self.control.alpha
+        discount = self.control.discount
+        control = self.control.name
+
+        state = environment.get_start_state()
+        action = action_value.choose_next_action(state, greedy=greedy)
+        episode_reward = 0.0
+        for _ in range(environment.timeout):
+            next_state = int(transitions[state, action])
+            reward = rewards[state, action]
+            episode_reward += reward
+
+            next_action = action_value.choose_next_action(next_state,
+                                                          greedy=greedy)
+            if control == 'sarsa':
+                bootstrap = table[next_state, next_action]
+            elif control == 'qlearning':
+                bootstrap = table[next_state].max()
+            else:
+                bootstrap = action_value.get_expected_action_value(next_state)
+            table[state, action] += \
+                alpha*(reward + discount*bootstrap - table[state, action])
+
+            # Only reaching the goal yields a zero reward, so it doubles as
+            # the termination signal
+            if reward == 0:
+                break
+            state = next_state
+            action = next_action
+        return episode_reward